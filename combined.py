@@ -7,8 +7,11 @@ import json
 import os
 import shutil
 import uuid
+import heapq
 from datetime import datetime
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict
+from eventlog import EventLog, is_sync_message
+from diagnostics import SamplingProfiler, Watchdog, dump_stacks, install_signal_handler
 
 # LoRa module handler
 class E22_900T22U:
@@ -20,14 +23,29 @@ class E22_900T22U:
     CMD_RESET = 0xC4
     MODE_NORMAL = 0
     MODE_CONFIG = 3
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
 
-    def __init__(self, port: str, baudrate: int = 9600, receive_callback: Optional[Callable[[bytes], None]] = None):
+    def __init__(self, port: str, baudrate: int = 9600, receive_callback: Optional[Callable[[bytes], None]] = None,
+                 write_timeout: float = 1.0, queue_size: int = 32):
         self.port = port
         self.baudrate = baudrate
         self.serial_conn: Optional[serial.Serial] = None
         self.receive_callback = receive_callback
+        self.write_timeout = write_timeout
+        self.queue_size = queue_size
         self._recv_thread: Optional[threading.Thread] = None
         self._recv_thread_running = False
+        # single writer thread, heap of [priority, seq, packet, coalesce_key]
+        self._send_queue: list = []
+        self._send_coalesce: Dict[str, list] = {}
+        self._send_cond = threading.Condition()
+        self._send_seq = 0
+        self._send_thread: Optional[threading.Thread] = None
+        self._send_thread_running = False
+        # progress markers (time.monotonic) for stall detection
+        self.last_poll = time.monotonic()
+        self.writing_since: Optional[float] = None
 
     def connect(self) -> bool:
         try:
@@ -37,16 +55,19 @@ class E22_900T22U:
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=0.1
+                timeout=0.1,
+                write_timeout=self.write_timeout
             )
             time.sleep(0.1)
             self._start_background_receive()
+            self._start_background_send()
             return True
         except Exception as e:
             print(f"LoRa connection failed: {e}")
             return False
 
     def disconnect(self):
+        self._stop_background_send()
         self._stop_background_receive()
         if self.serial_conn and self.serial_conn.is_open:
             self.serial_conn.close()
@@ -54,19 +75,66 @@ class E22_900T22U:
     def _set_mode_normal(self):
         time.sleep(0.01)
 
-    def send_data(self, data: bytes) -> bool:
+    def send_data(self, data: bytes, priority: int = PRIORITY_NORMAL,
+                  coalesce_key: Optional[str] = None) -> bool:
+        """queue data for the writer thread, False if the queue is full.
+        a still queued packet with the same coalesce_key is replaced."""
         if not self.serial_conn or not self.serial_conn.is_open:
             return False
-        self._set_mode_normal()
-        try:
-            self.serial_conn.write(data)
-            return True
-        except Exception as e:
-            print(f"LoRa send error: {e}")
-            return False
+        with self._send_cond:
+            if coalesce_key is not None and coalesce_key in self._send_coalesce:
+                self._send_coalesce[coalesce_key][2] = data
+                return True
+            if len(self._send_queue) >= self.queue_size:
+                print("LoRa send queue full, dropping packet")
+                return False
+            item = [priority, self._send_seq, data, coalesce_key]
+            self._send_seq += 1
+            heapq.heappush(self._send_queue, item)
+            if coalesce_key is not None:
+                self._send_coalesce[coalesce_key] = item
+            self._send_cond.notify()
+        return True
+
+    def _send_loop(self):
+        while True:
+            with self._send_cond:
+                while self._send_thread_running and not self._send_queue:
+                    self._send_cond.wait()
+                if not self._send_thread_running:
+                    return
+                item = heapq.heappop(self._send_queue)
+                if item[3] is not None:
+                    self._send_coalesce.pop(item[3], None)
+            self.writing_since = time.monotonic()
+            self._set_mode_normal()
+            try:
+                self.serial_conn.write(item[2])
+            except serial.SerialTimeoutException:
+                print("LoRa send error: write timed out")
+            except Exception as e:
+                print(f"LoRa send error: {e}")
+            self.writing_since = None
+
+    def _start_background_send(self):
+        if self._send_thread_running:
+            return
+        self._send_thread_running = True
+        self._send_thread = threading.Thread(target=self._send_loop, name='lora_writer', daemon=True)
+        self._send_thread.start()
+
+    def _stop_background_send(self):
+        with self._send_cond:
+            self._send_thread_running = False
+            self._send_queue.clear()
+            self._send_coalesce.clear()
+            self._send_cond.notify_all()
+        if self._send_thread:
+            self._send_thread.join()
 
     def _receive_loop(self):
         while self._recv_thread_running:
+            self.last_poll = time.monotonic()
             try:
                 if self.serial_conn and self.serial_conn.in_waiting > 0:
                     incoming = self.serial_conn.read(self.serial_conn.in_waiting)
@@ -80,7 +148,7 @@ class E22_900T22U:
         if self._recv_thread_running:
             return
         self._recv_thread_running = True
-        self._recv_thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self._recv_thread = threading.Thread(target=self._receive_loop, name='lora_receive', daemon=True)
         self._recv_thread.start()
 
     def _stop_background_receive(self):
@@ -110,6 +178,8 @@ class IntersectionNode:
         self.overload_active = False
         self.overload_road: Optional[str] = None
         self.overload_ends_at = 0
+        # replicated overload/emergency log
+        self.events = EventLog(self.intersection, None if temp else f"log_{self.intersection}.txt")
         # setup LoRa
         self.lora = E22_900T22U(lora_port, baudrate, receive_callback=self._on_receive)
         if not self.lora.connect():
@@ -117,18 +187,30 @@ class IntersectionNode:
         # init state
         #delete_files(self.frontier_dir)  # remove for testing; remove if persistent desired
         self.load_frontier()
+        # diagnostics: "profile" command or SIGUSR1 toggles the profiler, watchdog dumps stacks on stalls
+        self.profiler = SamplingProfiler(f"profile_{self.intersection}")
+        install_signal_handler(self.profiler)
+        self.watchdog = Watchdog(f"stacks_{self.intersection}")
+        self.watchdog.watch('main', 5)
+        self.watchdog.watch('auto_switch', 5)
+        self.watchdog.watch('send_loop', self.switch_interval + 10)
+        self.watchdog.watch('lora_receive', 5, lambda: self.lora.last_poll)
+        self.watchdog.watch('lora_writer', self.lora.write_timeout + 5,
+                            lambda: self.lora.writing_since or time.monotonic())
+        self.watchdog.start()
         print(f"[{self.intersection}] MAIN ROAD green")
         # start threads
-        threading.Thread(target=self._auto_switch, daemon=True).start()
-        threading.Thread(target=self._send_loop, daemon=True).start()
+        threading.Thread(target=self._auto_switch, name='auto_switch', daemon=True).start()
+        threading.Thread(target=self._send_loop, name='send_loop', daemon=True).start()
         # input overload
-        threading.Thread(target=self._overload_input, daemon=True).start()
+        threading.Thread(target=self._overload_input, name='console', daemon=True).start()
         self._run_intersections()
     
     def _run_intersections(self):
         global last_merge_time, overload_active, overload_road, overload_ends_at #to save when we merged last
         while True:
             time.sleep(0.1) #check very often
+            self.watchdog.beat('main')
 
             #check if overload expired
             if self.overload_active:
@@ -175,6 +257,7 @@ class IntersectionNode:
     def _auto_switch(self):
         while True:
             time.sleep(0.1)
+            self.watchdog.beat('auto_switch')
             now = time.time()
             if self.overload_active:
                 if now >= self.overload_ends_at:
@@ -198,7 +281,8 @@ class IntersectionNode:
 
     def _switch_light(self):
         if self.overload_active and self.overload_road:
-            print(f"[{self.intersection}] OVERLOAD: Holding {self.overload_road.upper()} ROAD green")
+            state = f"OVERLOAD: Holding {self.overload_road.upper()} ROAD green"
+            print(f"[{self.intersection}] {state}")
         else:
             idx = self.frontier[self.intersection]
             state = "MAIN ROAD green" if idx % 2 == 0 else "SIDE ROAD green"
@@ -212,9 +296,12 @@ class IntersectionNode:
 
     def _send_loop(self):
         while True:
+            self.watchdog.beat('send_loop')
             if not self.overload_active:
                 msg = json.dumps(self.frontier).encode('utf-8')
-                self.lora.send_data(msg)
+                self.lora.send_data(msg, coalesce_key='frontier')  # only the newest frontier matters
+            # let peers reconcile the event log with us
+            self.lora.send_data(json.dumps(self.events.digest()).encode('utf-8'), coalesce_key='digest')
             time.sleep(self.switch_interval)
 
     def _on_receive(self, data: bytes):
@@ -227,6 +314,11 @@ class IntersectionNode:
             received = json.loads(payload)
         except:
             return
+        if is_sync_message(received):
+            for reply in self.events.handle(received):
+                if not self.lora.send_data(json.dumps(reply).encode('utf-8')):
+                    break  # radio queue full, the next digest restarts the round
+            return
         # overload detection
         reason = received.get('reason')
         if reason and reason.startswith('overload_'):
@@ -258,15 +350,25 @@ class IntersectionNode:
         print(f"Traffic states - {', '.join(states)}")
 
     def _log_entry(self, entry: dict):
-        fn = f"log_{self.intersection}.txt"
-        with open(fn, 'a') as f:
-            f.write(json.dumps(entry)+'\n')
+        self.events.add(entry)
         self.frontier.setdefault(entry['intersection_id'], 0)
         self.save_frontier()
 
     def _overload_input(self):
         while True:
             cmd = input().strip().lower().split()
+            if cmd and cmd[0]=='profile':
+                # profile [seconds], again while running stops early
+                try:
+                    seconds = float(cmd[1]) if len(cmd)==2 else 30
+                except ValueError:
+                    print("usage: profile [seconds]")
+                    continue
+                self.profiler.toggle(seconds)
+                continue
+            if cmd and cmd[0]=='stacks':
+                print(f"Stacks written to {dump_stacks(f'stacks_{self.intersection}', 'requested')}")
+                continue
             if cmd and cmd[0]=='overload' and len(cmd)==2:
                 road=cmd[1]
                 entry = {
@@ -277,7 +379,8 @@ class IntersectionNode:
                     'timestamp': current_timestamp()
                 }
                 self._log_entry(entry)
-                self.lora.send_data(json.dumps(entry).encode('utf-8'))
+                if not self.lora.send_data(json.dumps(entry).encode('utf-8'), priority=E22_900T22U.PRIORITY_HIGH):
+                    print(f"[{self.intersection}] Radio busy, overload not sent")
                 self.overload_active=True
                 self.overload_road=road
                 self.overload_ends_at=time.time()+10
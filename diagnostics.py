@@ -0,0 +1,154 @@
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+# On-demand sampling profiler and thread stall watchdog for a running node.
+# The profiler only has a thread while it is sampling, so it costs nothing when off.
+# Its output is in collapsed stack format, feed it to flamegraph.pl or speedscope.
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")  # microseconds, open(..., 'w') must not hit an older file
+
+
+def _thread_names() -> Dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+class SamplingProfiler:
+    def __init__(self, prefix: str, interval: float = 0.005):
+        """
+        args:
+            prefix: output files are <prefix>_<time>.folded
+            interval: seconds between samples
+        """
+        self.prefix = prefix
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float) -> bool:
+        if self.running:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(seconds,), name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """stop early, the samples so far are still written"""
+        self._stop.set()
+
+    def toggle(self, seconds: float):
+        if self.running:
+            self.stop()
+        else:
+            self.start(seconds)
+
+    def _run(self, seconds: float):
+        me = threading.get_ident()
+        counts = Counter()
+        samples = 0
+        end = time.monotonic() + seconds
+        print(f"Profiling for {seconds:g}s")
+        while time.monotonic() < end and not self._stop.wait(self.interval):
+            names = _thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                counts[";".join(reversed(stack))] += 1
+            samples += 1
+        path = f"{self.prefix}_{_stamp()}.folded"
+        with open(path, 'w') as f:
+            for stack, n in counts.most_common():
+                f.write(f"{stack} {n}\n")
+        print(f"Profile written to {path} ({samples} samples)")
+
+
+def dump_stacks(prefix: str, reason: str = "") -> str:
+    """write the stacks of all threads to <prefix>_<time>.txt"""
+    names = _thread_names()
+    path = f"{prefix}_{_stamp()}.txt"
+    with open(path, 'w') as f:
+        f.write(f"{datetime.now().isoformat()} {reason}\n")
+        for ident, frame in sys._current_frames().items():
+            f.write(f"\nThread {names.get(ident, ident)}:\n")
+            f.write("".join(traceback.format_stack(frame)))
+    return path
+
+
+class Watchdog:
+    def __init__(self, prefix: str, check_every: float = 1.0):
+        """
+        args:
+            prefix: stack dumps are <prefix>_<time>.txt
+            check_every: seconds between checks
+        """
+        self.prefix = prefix
+        self.check_every = check_every
+        self.watched: Dict[str, Tuple[float, Optional[Callable[[], float]]]] = {}
+        self.beats: Dict[str, float] = {}
+        self.stalled = set()
+
+    def watch(self, name: str, threshold: float, progress: Optional[Callable[[], float]] = None):
+        """
+        watch a thread. progress returns the time.monotonic() of its last progress,
+        without it the thread has to call beat(name) itself.
+        """
+        self.watched[name] = (threshold, progress)
+        self.beats[name] = time.monotonic()
+
+    def beat(self, name: str):
+        self.beats[name] = time.monotonic()
+
+    def start(self):
+        threading.Thread(target=self._loop, name="watchdog", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.check_every)
+            now = time.monotonic()
+            new = []  # threads that stalled since the last pass
+            for name, (threshold, progress) in list(self.watched.items()):
+                try:
+                    last = progress() if progress else self.beats[name]
+                except Exception:
+                    continue
+                if now - last > threshold:
+                    if name not in self.stalled:  # dump once per stall
+                        self.stalled.add(name)
+                        new.append(f"{name} stalled for {now - last:.1f}s")
+                elif name in self.stalled:
+                    self.stalled.discard(name)
+                    print(f"WATCHDOG: {name} recovered")
+            if new:
+                # one dump per pass, threads often stall together on the same lock or disk write
+                path = dump_stacks(self.prefix, ", ".join(new))
+                print(f"WATCHDOG: {', '.join(new)}, stacks in {path}")
+
+
+def install_signal_handler(profiler: SamplingProfiler, seconds: float = 30) -> bool:
+    """SIGUSR1 toggles the profiler. only works from the main thread and not on windows"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+    try:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle(seconds))
+        return True
+    except ValueError:
+        return False
@@ -3,6 +3,7 @@ import time
 import struct
 import threading
 import sys
+import heapq
 from typing import Optional, Callable, Dict, Any
 
 class E22_900T22U:
@@ -18,21 +19,41 @@ class E22_900T22U:
     # operation modes
     MODE_NORMAL = 0
     MODE_CONFIG = 3
+
+    # send priorities, lower goes out first
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
     
     def __init__(self, port: str, baudrate: int = 9600,
-                 receive_callback: Optional[Callable[[bytes], None]] = None):
+                 receive_callback: Optional[Callable[[bytes], None]] = None,
+                 write_timeout: float = 1.0, queue_size: int = 32):
         """
         args:
             port: serial port (for us Linux default:'/dev/ttyUSB0' or windows default: 'COM3')
             baudrate: UART baud rate
             receive_callback: optional function called on incoming data
+            write_timeout: seconds before a stuck UART write gives up
+            queue_size: max queued packets before send_data refuses new ones
         """
         self.port = port
         self.baudrate = baudrate
         self.serial_conn: Optional[serial.Serial] = None
         self.receive_callback = receive_callback
+        self.write_timeout = write_timeout
+        self.queue_size = queue_size
         self._recv_thread: Optional[threading.Thread] = None
         self._recv_thread_running = False
+        # all writes go through one writer thread
+        self._send_queue: list = []  # heap of [priority, seq, packet, coalesce_key]
+        self._send_coalesce: Dict[str, list] = {}  # coalesce_key -> queued item
+        self._send_cond = threading.Condition()
+        self._send_seq = 0
+        self._write_lock = threading.Lock()
+        self._send_thread: Optional[threading.Thread] = None
+        self._send_thread_running = False
+        # progress markers (time.monotonic) for stall detection
+        self.last_poll = time.monotonic()
+        self.writing_since: Optional[float] = None
 
     def connect(self) -> bool:
         """open serial port and start reciever in background"""
@@ -43,17 +64,20 @@ class E22_900T22U:
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=0.1  # non-blocking read
+                timeout=0.1,  # non-blocking read
+                write_timeout=self.write_timeout
             )
             time.sleep(0.1)
             self._start_background_receive()
+            self._start_background_send()
             return True
         except Exception as e:
             print(f"Connection failed: {e}")
             return False
 
     def disconnect(self):
-        """stop receiver & close port"""
+        """stop receiver and writer & close port"""
+        self._stop_background_send()
         self._stop_background_receive()
         if self.serial_conn and self.serial_conn.is_open:
             self.serial_conn.close()
@@ -63,26 +87,83 @@ class E22_900T22U:
 
     def send_data(self, data: bytes,
                   address: Optional[int] = None,
-                  channel: Optional[int] = None) -> bool:
-        """send data while receiver thread also runs"""
+                  channel: Optional[int] = None,
+                  priority: int = PRIORITY_NORMAL,
+                  coalesce_key: Optional[str] = None) -> bool:
+        """
+        queue data for the writer thread, does not block on the UART.
+        a packet with the same coalesce_key that is still queued gets replaced,
+        so only the newest one goes out. returns False if the queue is full.
+        """
         if not self.serial_conn or not self.serial_conn.is_open:
             return False
 
-        self._set_mode_normal()
-        try:
-            if address is not None and channel is not None:
-                packet = struct.pack('>HB', address, channel) + data
-            else:
-                packet = data
-            self.serial_conn.write(packet)
-            return True
-        except Exception as e:
-            print(f"Send error: {e}")
-            return False
+        if address is not None and channel is not None:
+            packet = struct.pack('>HB', address, channel) + data
+        else:
+            packet = data
+        with self._send_cond:
+            if coalesce_key is not None and coalesce_key in self._send_coalesce:
+                self._send_coalesce[coalesce_key][2] = packet  # superseded, swap payload
+                return True
+            if len(self._send_queue) >= self.queue_size:
+                print("Send queue full, dropping packet")
+                return False
+            item = [priority, self._send_seq, packet, coalesce_key]
+            self._send_seq += 1
+            heapq.heappush(self._send_queue, item)
+            if coalesce_key is not None:
+                self._send_coalesce[coalesce_key] = item
+            self._send_cond.notify()
+        return True
+
+    def pending_sends(self) -> int:
+        """number of packets waiting for the writer"""
+        with self._send_cond:
+            return len(self._send_queue)
+
+    def _send_loop(self):
+        """internal thread: write queued packets one at a time"""
+        while True:
+            with self._send_cond:
+                while self._send_thread_running and not self._send_queue:
+                    self._send_cond.wait()
+                if not self._send_thread_running:
+                    return
+                item = heapq.heappop(self._send_queue)
+                if item[3] is not None:
+                    self._send_coalesce.pop(item[3], None)
+            self.writing_since = time.monotonic()
+            self._set_mode_normal()
+            try:
+                with self._write_lock:
+                    self.serial_conn.write(item[2])
+            except serial.SerialTimeoutException:
+                print("Send error: write timed out")
+            except Exception as e:
+                print(f"Send error: {e}")
+            self.writing_since = None
+
+    def _start_background_send(self):
+        if self._send_thread_running:
+            return
+        self._send_thread_running = True
+        self._send_thread = threading.Thread(target=self._send_loop, daemon=True)
+        self._send_thread.start()
+
+    def _stop_background_send(self):
+        with self._send_cond:
+            self._send_thread_running = False
+            self._send_queue.clear()
+            self._send_coalesce.clear()
+            self._send_cond.notify_all()
+        if self._send_thread:
+            self._send_thread.join()
 
     def _receive_loop(self):
         """internal thread: non-blocking read and callback"""
         while self._recv_thread_running:
+            self.last_poll = time.monotonic()
             try:
                 if self.serial_conn and self.serial_conn.in_waiting > 0:
                     incoming = self.serial_conn.read(self.serial_conn.in_waiting)
@@ -110,7 +191,8 @@ class E22_900T22U:
             return None
         self._set_mode_normal()
         pkt = struct.pack('B', command) + data
-        self.serial_conn.write(pkt)
+        with self._write_lock:
+            self.serial_conn.write(pkt)
         time.sleep(0.1)
         resp = b''
         while self.serial_conn.in_waiting > 0:
@@ -0,0 +1,263 @@
+import bisect
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Overload/emergency events as a grow-only set replicated between junctions.
+# Peers reconcile with range-based set reconciliation: both sides compare XOR
+# fingerprints of the entry ids in a range and only split ranges that differ,
+# so only the missing entries go over the air.
+#
+# messages:
+#   {"sync": <from>, "to": <peer or null>, "r": [range, ...]}
+#       range is ["f", lo, hi, fingerprint] or ["i", lo, hi, [ids]]
+#       lo is inclusive, hi exclusive, hi null means open end
+#   {"want": <from>, "to": <peer>, "ids": [ids]}
+#   {"entries": [entry, ...]}
+
+SPLIT = 16  # sub ranges per differing range
+LIST_LIMIT = 16  # send plain id lists below this size
+MAX_MESSAGE = 230  # bytes, fits one E22 sub packet (240) and the 1024 byte UDP reads
+
+
+def _hash(entry_id: str) -> int:
+    return int.from_bytes(hashlib.sha256(entry_id.encode('utf-8')).digest()[:8], 'big')
+
+
+def is_sync_message(msg: dict) -> bool:
+    return 'sync' in msg or 'want' in msg or 'entries' in msg
+
+
+def _valid_entry(entry) -> bool:
+    return isinstance(entry, dict) and isinstance(entry.get('id'), str)
+
+
+def _valid_range(rng) -> bool:
+    """a range from a peer: [kind, lo, hi, value] with the types _split produces"""
+    if not isinstance(rng, list) or len(rng) != 4:
+        return False
+    kind, lo, hi, value = rng
+    if not isinstance(lo, str) or not (hi is None or isinstance(hi, str)):
+        return False
+    if kind == 'f':
+        return isinstance(value, str)
+    if kind == 'i':
+        return isinstance(value, list) and all(isinstance(eid, str) for eid in value)
+    return False
+
+
+def _bound(prev: str, cur: str) -> str:
+    """shortest prefix of cur that still sorts after prev, keeps range bounds small"""
+    n = 0
+    while n < len(prev) and n < len(cur) and prev[n] == cur[n]:
+        n += 1
+    return cur[:n + 1]
+
+
+def _size(msg: dict) -> int:
+    return len(json.dumps(msg, separators=(',', ':')).encode('utf-8'))
+
+
+def _pack(base: dict, key: str, items: list) -> List[dict]:
+    """spread items over as few messages below MAX_MESSAGE as possible"""
+    out, cur, size = [], [], _size(dict(base, **{key: []}))
+    for item in items:
+        n = _size(item) + 1
+        if cur and size + n > MAX_MESSAGE:
+            out.append(dict(base, **{key: cur}))
+            cur, size = [], _size(dict(base, **{key: []}))
+        cur.append(item)
+        size += n
+    if cur:
+        out.append(dict(base, **{key: cur}))
+    return out
+
+
+class EventLog:
+    def __init__(self, node_id: str, path: Optional[str] = None):
+        """
+        args:
+            node_id: intersection id, used to address sync replies
+            path: log file, one JSON entry per line; None keeps it in memory
+        """
+        self.node_id = node_id
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        self.ids: List[str] = []  # sorted
+        self.hashes: Dict[str, int] = {}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if _valid_entry(entry):
+                        self._insert(entry)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self.entries
+
+    def _insert(self, entry: dict) -> bool:
+        eid = entry['id']
+        if eid in self.entries:
+            return False
+        h = _hash(eid)  # before touching any state, entries/ids/hashes must stay in step
+        self.entries[eid] = entry
+        self.hashes[eid] = h
+        bisect.insort(self.ids, eid)
+        return True
+
+    def add(self, entry: dict) -> bool:
+        """add an entry, False if it was already known or has no string id"""
+        if not _valid_entry(entry):
+            return False
+        with self.lock:
+            if not self._insert(entry):
+                return False
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+            return True
+
+    def _slice(self, lo: str, hi: Optional[str]) -> List[str]:
+        start = bisect.bisect_left(self.ids, lo)
+        end = len(self.ids) if hi is None else bisect.bisect_left(self.ids, hi)
+        return self.ids[start:end]
+
+    def _fingerprint(self, ids: List[str]) -> str:
+        fp = 0
+        for eid in ids:
+            fp ^= self.hashes[eid]
+        return f"{fp:016x}"
+
+    def digest(self) -> dict:
+        """sync message covering the whole log, broadcast to start a round"""
+        with self.lock:
+            return {"sync": self.node_id, "to": None, "r": [["f", "", None, self._fingerprint(self.ids)]]}
+
+    def _split(self, lo: str, hi: Optional[str], ids: List[str]) -> list:
+        if len(ids) <= LIST_LIMIT:
+            return [["i", lo, hi, ids]]
+        step = -(-len(ids) // SPLIT)
+        bounds = [lo] + [_bound(ids[k - 1], ids[k]) for k in range(step, len(ids), step)] + [hi]
+        out = []
+        for a, b in zip(bounds, bounds[1:]):
+            part = self._slice(a, b)
+            out.append(["f", a, b, self._fingerprint(part)])
+        return out
+
+    def handle(self, msg: dict) -> List[dict]:
+        """apply a sync message from any peer, returns messages to send back. malformed parts are skipped"""
+        if 'entries' in msg:
+            if isinstance(msg['entries'], list):
+                for entry in msg['entries']:
+                    self.add(entry)
+            return []
+        if msg.get('to') not in (None, self.node_id):
+            return []
+        peer = msg.get('sync') or msg.get('want')
+        if not isinstance(peer, str) or peer == self.node_id:
+            return []
+        if 'want' in msg:
+            ids = msg.get('ids')
+            if not isinstance(ids, list):
+                return []
+            with self.lock:
+                found = [self.entries[eid] for eid in ids if isinstance(eid, str) and eid in self.entries]
+            return _pack({}, "entries", found)
+
+        ranges, push, want = [], [], []
+        received = msg.get('r')
+        if not isinstance(received, list):
+            return []
+        with self.lock:
+            for rng in received:
+                if not _valid_range(rng):
+                    continue
+                kind, lo, hi, value = rng
+                mine = self._slice(lo, hi)
+                if kind == 'f':
+                    if value != self._fingerprint(mine):
+                        ranges += self._split(lo, hi, mine)
+                else:
+                    theirs = set(value)
+                    push += [self.entries[eid] for eid in mine if eid not in theirs]
+                    want += [eid for eid in value if eid not in self.entries]
+        return (_pack({"sync": self.node_id, "to": peer}, "r", ranges) +
+                _pack({}, "entries", push) +
+                _pack({"want": self.node_id, "to": peer}, "ids", want))
+
+
+def _fake_entry(node: str, when: datetime) -> dict:
+    return {
+        "id": str(uuid.UUID(int=random.getrandbits(128))),  # seeded, unlike uuid4
+        "intersection_id": node,
+        "state": {"main": "RED", "side": "RED"},
+        "reason": random.choice(["overload_M", "overload_S", "emergency"]),
+        "timestamp": when.isoformat() + ' '
+    }
+
+
+def benchmark(history: int = 20000, per_day: int = 1440, air_rate: int = 2400):
+    """
+    bytes and airtime to resync a node that was offline for a day,
+    range reconciliation vs retransmitting the whole log.
+    air_rate is the LoRa air data rate in bit/s (E22 default 2.4k).
+    """
+    random.seed(0)
+    start = datetime(2026, 1, 1)
+    shared = [_fake_entry(random.choice("ABC"), start + timedelta(minutes=i)) for i in range(history)]
+    missed = [_fake_entry(random.choice("BC"), start + timedelta(days=29, minutes=i)) for i in range(per_day)]
+    a, b = EventLog("A"), EventLog("B")
+    for entry in shared:
+        a.add(entry)
+        b.add(entry)
+    for entry in missed:
+        b.add(entry)
+
+    sent, rounds, messages = 0, 0, 0
+    queue = [("B", a.digest())]  # A comes back online and broadcasts its digest
+    while queue:
+        rounds += 1
+        nxt = []
+        for dest, msg in queue:
+            sent += _size(msg)
+            messages += 1
+            node = b if dest == "B" else a
+            other = "A" if dest == "B" else "B"
+            nxt += [(other, reply) for reply in node.handle(msg)]
+        queue = nxt
+    assert len(a) == len(b)
+
+    naive = sum(_size(m) for m in _pack({}, "entries", list(b.entries.values())))
+    result = {
+        "history": history,
+        "missed": per_day,
+        "reconcile_bytes": sent,
+        "reconcile_messages": messages,
+        "reconcile_rounds": rounds,
+        "reconcile_airtime_s": round(sent * 8 / air_rate, 1),
+        "naive_bytes": naive,
+        "naive_airtime_s": round(naive * 8 / air_rate, 1),
+        "missing_entries_bytes": sum(_size(e) for e in missed)
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == '__main__':
+    # python eventlog.py [history] [missed per day]
+    history = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 1440
+    benchmark(history, per_day)
@@ -0,0 +1,214 @@
+import json
+import socket
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from e22LoRa import E22_900T22U
+
+# Gateway: listens on the radio, coalesces frontier and event messages and
+# forwards them to a central aggregator in compressed UDP batches.
+# Aggregator: keeps the city-wide frontier in memory and serves it as JSON over HTTP.
+
+MAX_DATAGRAM = 1200  # stay below a typical MTU
+
+
+def encode_batch(frontier: Dict[str, int], events: list) -> bytes:
+    return zlib.compress(json.dumps({"f": frontier, "e": events}, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_batch(data: bytes) -> Tuple[Dict[str, int], list]:
+    batch = json.loads(zlib.decompress(data).decode('utf-8'))
+    return batch.get("f", {}), batch.get("e", [])
+
+
+def split_messages(text: str) -> list:
+    """a radio read can hold several JSON objects back to back, or garbage"""
+    decoder = json.JSONDecoder()
+    msgs = []
+    i = 0
+    while i < len(text):
+        start = text.find('{', i)
+        if start < 0:
+            break
+        try:
+            obj, end = decoder.raw_decode(text, start)
+        except ValueError:
+            i = start + 1
+            continue
+        if isinstance(obj, dict):
+            msgs.append(obj)
+        i = end
+    return msgs
+
+
+class Gateway:
+    def __init__(self, lora_port: str, aggregator: Tuple[str, int],
+                 baudrate: int = 9600, flush_interval: float = 1.0):
+        self.aggregator = aggregator
+        self.flush_interval = flush_interval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.lock = threading.Lock()
+        self.pending: Dict[str, int] = {}  # frontier entries changed since the last flush
+        self.events: Dict[str, dict] = {}  # event id -> entry, duplicates from repeaters collapse
+        self.seen: Dict[str, int] = {}  # everything already forwarded, to drop stale gossip
+        self.lora = E22_900T22U(lora_port, baudrate, receive_callback=self._on_receive)
+
+    def start(self):
+        if not self.lora.connect():
+            raise ConnectionError(f"Cannot connect LoRa on {self.lora.port}")
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def _on_receive(self, data: bytes):
+        for msg in split_messages(data.decode('utf-8', errors='ignore')):
+            self.handle(msg)
+
+    def handle(self, msg: dict):
+        with self.lock:
+            if 'reason' in msg and 'id' in msg:  # overload / emergency entry
+                if isinstance(msg['id'], str):
+                    self.events[msg['id']] = msg
+                return
+            for uid, cnt in msg.items():
+                if not isinstance(cnt, int) or isinstance(cnt, bool):
+                    continue  # same filter as Aggregator.apply
+                if cnt > self.seen.get(uid, -1) and cnt > self.pending.get(uid, -1):
+                    self.pending[uid] = cnt  # only the newest value matters
+
+    def flush(self) -> int:
+        """send everything pending, returns number of datagrams"""
+        with self.lock:
+            frontier, self.pending = self.pending, {}
+            events, self.events = list(self.events.values()), {}
+            self.seen.update(frontier)
+        if not frontier and not events:
+            return 0
+        sent = 0
+        for datagram in self._pack(frontier, events):
+            try:
+                self.sock.sendto(datagram, self.aggregator)
+                sent += 1
+            except OSError as e:
+                print(f"Uplink error: {e}")
+        return sent
+
+    def _pack(self, frontier: Dict[str, int], events: list) -> list:
+        data = encode_batch(frontier, events)
+        if len(data) <= MAX_DATAGRAM or (len(frontier) + len(events)) <= 1:
+            return [data]
+        # too big for one datagram: send frontier and events apart, or halve
+        # whichever is left. a single oversized item goes out as is
+        if frontier and events:
+            return self._pack(frontier, []) + self._pack({}, events)
+        if len(frontier) > 1:
+            items = list(frontier.items())
+            half = len(items) // 2
+            return self._pack(dict(items[:half]), []) + self._pack(dict(items[half:]), [])
+        half = len(events) // 2
+        return self._pack({}, events[:half]) + self._pack({}, events[half:])
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def stop(self):
+        self.flush()
+        self.lora.disconnect()
+        self.sock.close()
+
+
+class Aggregator:
+    def __init__(self, port: int, http_port: Optional[int] = None, max_events: int = 1000):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("", port))
+        self.port = self.sock.getsockname()[1]
+        self.http_port = http_port
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.frontier: Dict[str, int] = {}
+        self.events: Dict[str, dict] = {}
+        self.batches = 0
+
+    def start(self):
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+        if self.http_port is not None:
+            threading.Thread(target=self._serve, daemon=True).start()
+
+    def apply(self, data: bytes):
+        try:
+            frontier, events = decode_batch(data)
+        except Exception as e:
+            print(f"Bad batch: {e}")
+            return
+        if not isinstance(frontier, dict) or not isinstance(events, list):
+            print("Bad batch: wrong layout")
+            return
+        with self.lock:
+            self.batches += 1
+            for uid, cnt in frontier.items():
+                if not isinstance(cnt, int) or isinstance(cnt, bool):
+                    continue  # anyone on the network can send to us
+                if cnt > self.frontier.get(uid, -1):
+                    self.frontier[uid] = cnt
+            for entry in events:
+                if isinstance(entry, dict) and isinstance(entry.get('id'), str):
+                    self.events[entry['id']] = entry
+            while len(self.events) > self.max_events:  # keep the newest
+                del self.events[next(iter(self.events))]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"frontier": dict(self.frontier), "events": list(self.events.values()),
+                    "batches": self.batches}
+
+    def _receive_loop(self):
+        while True:
+            data, addr = self.sock.recvfrom(65535)
+            try:
+                self.apply(data)
+            except Exception as e:  # one bad datagram must not stop the aggregator
+                print(f"Bad batch from {addr}: {e}")
+
+    def _serve(self):
+        aggregator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(aggregator.snapshot()).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        ThreadingHTTPServer(("", self.http_port), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    # python gateway.py aggregator <udp port> <http port>
+    # python gateway.py gateway <serial port> <aggregator host> <aggregator port>
+    if len(sys.argv) > 1 and sys.argv[1] == 'aggregator':
+        udp_port = int(sys.argv[2]) if len(sys.argv) > 2 else 6000
+        http_port = int(sys.argv[3]) if len(sys.argv) > 3 else 8080
+        agg = Aggregator(udp_port, http_port)
+        agg.start()
+        print(f"Aggregator on udp {udp_port}, dashboard on http://localhost:{http_port}/")
+    else:
+        port = sys.argv[2] if len(sys.argv) > 2 else '/dev/ttyUSB0'
+        host = sys.argv[3] if len(sys.argv) > 3 else '127.0.0.1'
+        agg_port = int(sys.argv[4]) if len(sys.argv) > 4 else 6000
+        gw = Gateway(port, (host, agg_port))
+        gw.start()
+        print(f"Gateway on {port}, forwarding to {host}:{agg_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping...")
@@ -6,6 +6,8 @@ import shutil
 import utils
 import uuid
 from datetime import datetime
+from eventlog import EventLog, is_sync_message
+import timing
 
 intersection, port, host, interval, temp = utils.cli()
 frontier = {}
@@ -20,6 +22,11 @@ overload_ends_at = 0
 emergency_active = False
 emergency_ends_at = 0
 
+events = EventLog(intersection, f"log_{intersection}.txt") #overload/emergency log, replicated with the peers
+
+plan = None #adaptive timing plan, merged like the frontier
+plan_interval = 120 #seconds between plan updates from the coordinator, can be changed
+
 sock = utils.setup_socket("", port) 
 
 def current_timestamp(): #for creating timestamp for the log file
@@ -63,7 +70,7 @@ def run_intersections():
                     switch_light()
                 continue  #don't run CRDT switching
 
-        if time.time() - last_merge_time >= switch_interval: #after every switch-interval switch the traffic lights
+        if time.time() - last_merge_time >= green_time(): #after every green time switch the traffic lights
             if can_switch():
                 frontier[intersection] += 1
                 switch_light()
@@ -93,6 +100,35 @@ def switch_light(): #to change which street has green lights
             save_frontier() #update our frontier files
         last_merge_time = time.time() #set timestamp back
 
+def green_time(): #green time of the current phase, from the plan if we have one
+    if plan:
+        return plan["green"][frontier[intersection] % 2] #[main, side], the same for all junctions since we switch in lockstep
+    return switch_interval
+
+def adopt_plan(received): #keep the newest plan, like merging the frontier
+    global plan
+    merged = timing.merge_plan(plan, received)
+    if merged is None:
+        return
+    if plan is None or merged["plan"] != plan["plan"]:
+        print(f"[{intersection}] New timing plan {merged['plan']} from {merged['by']}: cycle {merged['cycle']} s")
+    plan = merged
+
+def plan_loop(): #the junction with the lowest id is the coordinator and computes the plan
+    while True:
+        time.sleep(plan_interval)
+        junctions = sorted(frontier) #corridor order along the main road
+        if not junctions or junctions[0] != intersection:
+            continue
+        try:
+            with events.lock:
+                entries = list(events.entries.values())
+            demand = timing.demand_from_events(junctions, entries)
+            version = plan["plan"] + 1 if plan else 1
+            adopt_plan(timing.make_plan(intersection, version, demand))
+        except Exception as e: #keep coordinating even if one round fails
+            print(f"[{intersection}] Could not compute timing plan: {e}")
+
 def can_switch():
     my_frontier = frontier.get(intersection, 0)
     return all(count == my_frontier for count in frontier.values()) #only switch when everyone is at the same step
@@ -102,6 +138,9 @@ def send():
         if not overload_active: #only send when not in overload
             message = json.dumps(frontier).encode("utf-8") #convert into JSON
             sock.sendto(message, (host, port)) #change this to LoRa
+        sock.sendto(json.dumps(events.digest()).encode("utf-8"), (host, port)) #so peers can find missing log entries
+        if plan: #keep spreading the plan so late peers get it
+            sock.sendto(json.dumps(plan).encode("utf-8"), (host, port))
         time.sleep(interval) #broadcast every interval
 
 def load_frontier():
@@ -128,9 +167,7 @@ def save_frontier():
             print(f"Error: {e}")
 
 def append_entry(entry): #append to log file and update frontier
-    log_file = f"log_{intersection}.txt"
-    with open(log_file, 'a') as f:
-        f.write(json.dumps(entry) + "\n")
+    events.add(entry) #ignores entries we already have
     frontier[entry['intersection_id']] = frontier.get(entry['intersection_id'], 0)
     if not temp:
         save_frontier()
@@ -141,6 +178,13 @@ def receive():
         data, addr = sock.recvfrom(1024) #change this to LoRa
         try:
             received = json.loads(data.decode("utf-8"))
+            if isinstance(received, dict) and is_sync_message(received): #log reconciliation, not a frontier
+                for reply in events.handle(received):
+                    sock.sendto(json.dumps(reply).encode("utf-8"), (host, port))
+                continue
+            if isinstance(received, dict) and "plan" in received: #timing plan, not a frontier
+                adopt_plan(received)
+                continue
             if isinstance(received, dict):
             	if received.get("reason") == "emergency":
                     append_entry(received)
@@ -226,6 +270,7 @@ print(f"[{intersection}] MAIN ROAD green")
 threading.Thread(target=send, daemon=True).start()
 threading.Thread(target=receive, daemon=True).start()
 threading.Thread(target=overload_input, daemon=True).start()
+threading.Thread(target=plan_loop, daemon=True).start()
 try:
     run_intersections()
 except KeyboardInterrupt:
@@ -0,0 +1,430 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+# Synthetic load generator for the receive/merge path.
+# Starts an intersection node as a subprocess and drives it either over UDP
+# (intersection.py) or over a pty that stands in for the E22 module (combined.py).
+# Latency is measured from send until the node prints a light change.
+# combined.py json-decodes whatever one serial poll returns, so over the pty frames
+# are paced to its poll interval and reads it could not parse are counted apart
+# from frames it parsed but did not apply.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class UdpTransport:
+    """send frames to a node listening on a UDP port"""
+    max_rate = float('inf')  # datagrams keep frames apart
+
+    def __init__(self, host: str, port: int):
+        self.addr = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def node_args(self) -> List[str]:
+        return []
+
+    def send(self, frame: bytes):
+        self.sock.sendto(frame, self.addr)
+
+    def close(self):
+        self.sock.close()
+
+
+class PtyTransport:
+    """fake E22 module: the node opens the pty slave as its serial port"""
+
+    def __init__(self, gap: float = 0.025):
+        """gap: min seconds between frames, the node polls the port every 10 ms"""
+        import pty
+        self.master, self.slave = pty.openpty()
+        self.port = os.ttyname(self.slave)
+        self.gap = gap
+        self.max_rate = 1.0 / gap
+        self._last = 0.0
+        self._running = True
+        # drain what the node sends back so its writes never block
+        threading.Thread(target=self._drain, daemon=True).start()
+
+    def node_args(self) -> List[str]:
+        return [self.port]
+
+    def send(self, frame: bytes):
+        # back to back writes would reach the node glued into one read
+        wait = self._last + self.gap - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        os.write(self.master, frame)
+        self._last = time.perf_counter()
+
+    def _drain(self):
+        while self._running:
+            try:
+                os.read(self.master, 4096)
+            except OSError:
+                return
+
+    def close(self):
+        self._running = False
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class ReceiveLog:
+    """follows receive_log_<id>.txt, where combined.py records every serial read"""
+
+    MARK = " RECEIVED | "
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+
+    def read(self) -> dict:
+        """reads since the last call, and how many of them were not valid JSON"""
+        stats = {"reads": 0, "unparsed_reads": 0, "glued_reads": 0}
+        if not os.path.exists(self.path):
+            return stats
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]  # leave a half written line for next time
+        self.offset += len(data)
+        for line in data.decode('utf-8', errors='ignore').splitlines():
+            if self.MARK not in line:
+                continue
+            raw = line.split(self.MARK, 1)[1]
+            stats["reads"] += 1
+            try:
+                json.loads(raw)
+            except ValueError:
+                stats["unparsed_reads"] += 1
+                if "}{" in raw:
+                    stats["glued_reads"] += 1
+        return stats
+
+
+class NodeProcess:
+    """runs a node and timestamps the lines it prints"""
+
+    def __init__(self, cmd: List[str], cwd: str):
+        self.proc = subprocess.Popen(cmd, cwd=cwd, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                     text=True, bufsize=1,
+                                     env=dict(os.environ, PYTHONUNBUFFERED="1"))
+        self.merged = 0  # "Traffic states" lines = frontier messages applied
+        self.switches: List[float] = []  # times of "Switching to" lines
+        self.cond = threading.Condition()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            now = time.perf_counter()
+            with self.cond:
+                if line.startswith("Traffic states"):
+                    self.merged += 1
+                elif "Switching to" in line:
+                    self.switches.append(now)
+                self.cond.notify_all()
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def wait_switch(self, after: float, timeout: float) -> Optional[float]:
+        """first light change seen after the given time, None on timeout"""
+        deadline = time.perf_counter() + timeout
+        with self.cond:
+            while True:
+                for t in self.switches:
+                    if t >= after:
+                        return t
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return None
+                self.cond.wait(left)
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+class LoadGenerator:
+    def __init__(self, transport, node: NodeProcess, peers: int, seed: int = 0,
+                 receive_log: Optional[ReceiveLog] = None):
+        self.transport = transport
+        self.node = node
+        self.receive_log = receive_log  # None when the node does not log reads (UDP)
+        self.rng = random.Random(seed)
+        self.peers = [f"peer{i}" for i in range(peers)]
+        self.counter = 0  # highest frontier value we have gossiped
+        self.sent = {"gossip": 0, "overload": 0, "emergency": 0, "malformed": 0, "truncated": 0}
+
+    def gossip_frame(self, size: int = 8) -> bytes:
+        msg = {p: self.rng.randint(0, self.counter) for p in self.rng.sample(self.peers, min(size, len(self.peers)))}
+        return json.dumps(msg).encode("utf-8")
+
+    def event_frame(self, reason: str) -> bytes:
+        state = {"main": "RED", "side": "RED"}
+        if reason == "overload_M":
+            state = {"main": "GREEN", "side": "RED"}
+        elif reason == "overload_S":
+            state = {"main": "RED", "side": "GREEN"}
+        entry = {
+            "id": str(uuid.uuid4()),
+            "intersection_id": self.rng.choice(self.peers),
+            "state": state,
+            "reason": reason,
+            "timestamp": datetime.now().isoformat() + " "
+        }
+        return json.dumps(entry).encode("utf-8")
+
+    def malformed_frame(self) -> bytes:
+        # no line breaks, the node's receive log is line based
+        return bytes(self.rng.choice([b for b in range(256) if b not in (10, 13)])
+                     for _ in range(self.rng.randint(1, 64)))
+
+    def truncated_frame(self) -> bytes:
+        frame = self.gossip_frame()
+        return frame[:self.rng.randint(1, len(frame) - 1)]
+
+    def probe(self, timeout: float) -> Optional[float]:
+        """gossip a frontier ahead of the node so it catches up, return latency in s"""
+        self.counter += 1
+        frame = json.dumps({self.rng.choice(self.peers): self.counter}).encode("utf-8")
+        start = time.perf_counter()
+        self.transport.send(frame)
+        seen = self.node.wait_switch(start, timeout)
+        return None if seen is None else seen - start
+
+    def probes(self, count: int, timeout: float):
+        """latencies of up to count probes and how many got no light change, stops if the node dies"""
+        latencies, lost = [], 0
+        for _ in range(count):
+            if not self.node.alive:
+                break
+            lat = self.probe(timeout)
+            if lat is None:
+                lost += 1
+            else:
+                latencies.append(lat)
+            time.sleep(0.05)
+        return latencies, lost
+
+    def storm(self, rate: float, duration: float, mix: dict) -> float:
+        """
+        send a mixed storm at a fixed rate, mix maps frame kind to weight.
+        the rate is capped by what the transport can frame, returns the rate used
+        """
+        rate = min(rate, self.transport.max_rate)
+        kinds = list(mix)
+        weights = [mix[k] for k in kinds]
+        gap = 1.0 / rate
+        end = time.perf_counter() + duration
+        nxt = time.perf_counter()
+        while nxt < end and self.node.alive:  # a dead node stops reading, the pty would fill up
+            kind = self.rng.choices(kinds, weights)[0]
+            if kind == "gossip":
+                frame = self.gossip_frame()
+            elif kind == "overload":
+                frame = self.event_frame(self.rng.choice(["overload_M", "overload_S"]))
+            elif kind == "emergency":
+                frame = self.event_frame("emergency")
+            elif kind == "malformed":
+                frame = self.malformed_frame()
+            else:
+                frame = self.truncated_frame()
+            self.transport.send(frame)
+            self.sent[kind] += 1
+            nxt += gap
+            delay = nxt - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return rate
+
+    def max_sustained_rate(self, start: float, step: float, limit: float,
+                           duration: float, settle: float):
+        """
+        ramp gossip rate until frames get lost. a frame is a parse failure when the
+        node could not decode the read it arrived in, and a drop when it decoded
+        but was not applied. returns the best rate, the per step numbers and why
+        the ramp stopped: "loss", "limit" (no loss up to the limit or the
+        transport cap, so the node was not saturated) or "node_died"
+        """
+        best = 0.0
+        steps = []
+        rate = start
+        limit = min(limit, self.transport.max_rate)
+        if self.receive_log:
+            self.receive_log.read()  # skip what came before the ramp
+        while rate <= limit:
+            before = self.node.merged
+            sent = self.sent["gossip"]
+            self.storm(rate, duration, {"gossip": 1})
+            time.sleep(settle)
+            sent = self.sent["gossip"] - sent
+            applied = self.node.merged - before
+            if not self.node.alive:  # missing frames are not the node's capacity
+                steps.append({"rate": rate, "sent": sent, "applied": applied, "node_died": True})
+                print(f"{rate:.0f} msg/s: node exited with {self.node.proc.returncode}")
+                return best, steps, "node_died"
+            if self.receive_log:
+                reads = self.receive_log.read()
+                delivered = reads["reads"] - reads["unparsed_reads"]
+                parse_failures = max(sent - delivered, 0)
+            else:
+                delivered, parse_failures = sent, None
+            drops = max(delivered - applied, 0)
+            steps.append({"rate": rate, "sent": sent, "applied": applied,
+                          "parse_failures": parse_failures, "drops": drops})
+            if drops or parse_failures:
+                print(f"{rate:.0f} msg/s: {parse_failures or 0} unparsed, {drops} dropped of {sent}")
+                return best, steps, "loss"
+            print(f"{rate:.0f} msg/s: ok")
+            best = rate
+            rate += step
+        return best, steps, "limit"
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    def pick(p):
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    return {"min": values[0], "p50": pick(50), "p90": pick(90), "p99": pick(99),
+            "max": values[-1], "mean": sum(values) / len(values)}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=HERE, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic load for an intersection node")
+    parser.add_argument("--mode", choices=["udp", "pty"], default="pty")
+    parser.add_argument("--node", help="node script, default combined.py for pty and intersection.py for udp")
+    parser.add_argument("--node-arg", action="append", default=[], help="extra argument for the node, repeatable")
+    parser.add_argument("--id", default="A", help="intersection id of the node under test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--peers", type=int, default=1000, help="number of fake peers")
+    parser.add_argument("--probes", type=int, default=50, help="latency samples")
+    parser.add_argument("--probe-timeout", type=float, default=2.0)
+    parser.add_argument("--storm-rate", type=float, default=200.0, help="msg/s of the mixed storm")
+    parser.add_argument("--storm-seconds", type=float, default=10.0)
+    parser.add_argument("--pty-gap", type=float, default=0.025, help="min seconds between frames on the pty")
+    parser.add_argument("--ramp-start", type=float, help="default 5 msg/s for pty, 50 for udp")
+    parser.add_argument("--ramp-step", type=float, help="default 5 msg/s for pty, 50 for udp")
+    parser.add_argument("--ramp-limit", type=float, default=5000.0, help="also capped by the pty pacing")
+    parser.add_argument("--ramp-seconds", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="loadgen_results.json")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="loadgen_")  # node log and frontier files land here
+    if args.mode == "pty":
+        transport = PtyTransport(args.pty_gap)
+        script = args.node or "combined.py"
+        node_args = [args.id] + transport.node_args()
+        receive_log = ReceiveLog(os.path.join(workdir, f"receive_log_{args.id}.txt"))
+        ramp = 5.0
+    else:
+        transport = UdpTransport(args.host, args.port)
+        script = args.node or "intersection.py"
+        node_args = [args.id]
+        receive_log = None
+        ramp = 50.0
+    cmd = [sys.executable, os.path.join(HERE, script)] + node_args + args.node_arg
+
+    node = NodeProcess(cmd, workdir)
+    gen = LoadGenerator(transport, node, args.peers, args.seed, receive_log)
+    time.sleep(1)  # let the node connect
+    try:
+        # seed the frontier with all fake peers
+        for i in range(0, len(gen.peers), 50):
+            transport.send(json.dumps({p: 0 for p in gen.peers[i:i + 50]}).encode("utf-8"))
+            time.sleep(0.05)
+
+        # each phase only runs while the node is up, frames sent to a dead node
+        # would otherwise be counted as lost probes, parse failures or drops
+        died = None
+        storm_rate = storm_sent = storm_reads = storm_lost = max_rate = stopped = None
+        storm_latencies, ramp_steps = [], []
+        latencies, lost = gen.probes(args.probes, args.probe_timeout)
+        if not node.alive:
+            died = "probes"
+        else:
+            if receive_log:
+                receive_log.read()
+            # overload and emergency frames are in the mix on purpose, they hold the lights
+            # and write the state log, which is the slow path of a real node
+            storm_rate = gen.storm(args.storm_rate, args.storm_seconds,
+                                   {"gossip": 80, "overload": 5, "emergency": 1, "malformed": 7, "truncated": 7})
+            storm_sent = dict(gen.sent)
+            time.sleep(1)
+            storm_reads = receive_log.read() if receive_log else None
+            if not node.alive:
+                died = "storm"
+        if died is None:
+            time.sleep(16)  # wait out any overload or emergency the storm triggered
+            storm_latencies, storm_lost = gen.probes(10, args.probe_timeout)
+            if not node.alive:
+                died = "probes_after_storm"
+        if died is None:
+            max_rate, ramp_steps, stopped = gen.max_sustained_rate(args.ramp_start or ramp, args.ramp_step or ramp,
+                                                                   args.ramp_limit, args.ramp_seconds, settle=1.0)
+            if stopped == "node_died":
+                died = "ramp"
+        alive = node.alive
+        exit_code = node.proc.returncode
+    finally:
+        node.stop()
+        transport.close()
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "mode": args.mode,
+        "node": cmd,
+        "peers": args.peers,
+        "latency_s": percentiles(latencies),
+        "probes_lost": lost,
+        "latency_after_storm_s": percentiles(storm_latencies),
+        "probes_lost_after_storm": storm_lost,
+        "transport_max_msgs_per_s": transport.max_rate if args.mode == "pty" else None,
+        "storm": {"rate": storm_rate, "seconds": args.storm_seconds, "sent": storm_sent,
+                  "node_reads": storm_reads},
+        "max_sustained_msgs_per_s": max_rate,
+        # false: no loss up to --ramp-limit or the pty pacing, the node's capacity is higher
+        "saturated": None if stopped in (None, "node_died") else stopped == "loss",
+        "ramp": ramp_steps,
+        "node_alive": alive,
+        "node_died_during": died,
+        "node_exit_code": exit_code,
+        "workdir": workdir
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()